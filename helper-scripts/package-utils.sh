@@ -0,0 +1,18 @@
+#!/bin/bash
+
+# Function to load the installed system packages with a single dpkg-query, so
+# checking many packages doesn't fork dpkg once per package
+load_installed_packages() {
+	declare -gA INSTALLED_PACKAGES=()
+	INSTALLED_PACKAGES_LOADED=true
+	local pkg
+	while read -r pkg; do
+		INSTALLED_PACKAGES["$pkg"]=1
+	done < <(dpkg-query -W -f='${db:Status-Abbrev} ${Package}\n' 2>/dev/null | awk '$1 == "ii" {print $2}')
+}
+
+# Function to check if a system package is installed
+is_package_installed() {
+	[ "$INSTALLED_PACKAGES_LOADED" = "true" ] || load_installed_packages
+	[ -n "${INSTALLED_PACKAGES[$1]}" ]
+}
@@ -0,0 +1,32 @@
+#!/bin/bash
+
+# Directory holding one stamp file per provisioning step
+STAMP_DIR="$PLAYER_LOGS_DIR/.stamps"
+
+# Function to compute the stamp of a step from its inputs: files contribute
+# their content, anything else (code, commit ids, dates) is hashed as is
+compute_stamp() {
+	local input
+	for input in "$@"; do
+		if [ -f "$input" ]; then
+			cat "$input"
+		else
+			echo "$input"
+		fi
+	done | sha256sum | cut -d' ' -f1
+}
+
+# Function to check whether a step already ran with the given stamp
+stamp_is_current() {
+	local name=$1
+	local stamp=$2
+	[ "$SETUP_FORCE" != "true" ] && [ "$(cat "$STAMP_DIR/$name" 2>/dev/null)" = "$stamp" ]
+}
+
+# Function to record a successful run of a step
+write_stamp() {
+	local name=$1
+	local stamp=$2
+	mkdir -p "$STAMP_DIR"
+	echo "$stamp" >"$STAMP_DIR/$name"
+}
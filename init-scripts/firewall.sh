@@ -10,8 +10,8 @@ echo "---------- SETTING UP FIREWALL ----------"
 install_ufw() {
 	if ! command -v ufw &>/dev/null; then
 		echo "Installing UFW..."
-		sudo apt update
-		sudo apt install ufw -y
+		sudo apt update -o DPkg::Lock::Timeout=300
+		sudo apt install -o DPkg::Lock::Timeout=300 ufw -y
 		echo "UFW installed!"
 	else
 		echo "UFW is already installed!"
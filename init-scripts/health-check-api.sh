@@ -10,31 +10,28 @@ echo "---------- SETTING UP HEALTH CHECK API ----------"
 API_DIR="$ORANGEAD_ROOT_DIR/oaDeviceAPI"
 VENV_DIR="$API_DIR/.venv"
 
-# Function to check if a package is installed
-is_package_installed() {
-    dpkg -l "$1" &>/dev/null
+# Function to normalize Python package names for comparison (PEP 503)
+normalize_python_package_name() {
+    tr '[:upper:]' '[:lower:]' | sed -E 's/[-_.]+/-/g'
 }
 
-# Function to check if Python package is installed in venv with correct version
-is_python_package_installed() {
-    local package=$1
+# Function to load the packages installed in the venv with a single pip call
+load_installed_python_packages() {
+    INSTALLED_PYTHON_PACKAGES=""
     if [ ! -f "$VENV_DIR/bin/pip" ]; then
         echo "Debug: pip not found in venv"
-        return 1
+        return
     fi
-    
-    # Convert package name to lowercase for comparison
-    local package_lower=$(echo "$package" | tr '[:upper:]' '[:lower:]')
-    
-    # Get installed packages in lowercase
-    local installed_packages
-    installed_packages=$("$VENV_DIR/bin/pip" freeze | tr '[:upper:]' '[:lower:]')
-    
-    # Check if package exists (case-insensitive)
-    if echo "$installed_packages" | grep -q "^${package_lower}=="; then
+    INSTALLED_PYTHON_PACKAGES=$("$VENV_DIR/bin/pip" freeze | cut -d'=' -f1 | normalize_python_package_name)
+}
+
+# Function to check if Python package is installed in venv
+is_python_package_installed() {
+    local package=$(echo "$1" | normalize_python_package_name)
+    if grep -qx "$package" <<<"$INSTALLED_PYTHON_PACKAGES"; then
         return 0
     else
-        echo "Debug: Package $package not found"
+        echo "Debug: Package $1 not found"
         return 1
     fi
 }
@@ -87,7 +84,8 @@ setup_python_environment() {
     # Check if any package needs to be installed
     local need_install=0
     local missing_packages=()
-    
+
+    load_installed_python_packages
     for package in "${required_packages[@]}"; do
         if ! is_python_package_installed "$package"; then
             need_install=1
@@ -5,7 +5,7 @@ echo "---------- SETTING UP JQ FOR EDITING CHROMIUM PREFERENCE ----------"
 # Check if jq is installed
 if ! command -v jq &>/dev/null; then
     echo "Installing jq..."
-    sudo apt-get install -y jq
+    sudo apt-get install -y -o DPkg::Lock::Timeout=300 jq
 else
     echo "jq is already installed!"
 fi
@@ -5,7 +5,7 @@ echo "---------- SETTING UP HIDE CURSOR ----------"
 # Check if unclutter is installed
 if ! command -v unclutter &>/dev/null; then
     echo "Installing unclutter..."
-    sudo apt-get install -y unclutter
+    sudo apt-get install -y -o DPkg::Lock::Timeout=300 unclutter
     echo "unclutter installed!"
 else
     echo "unclutter is already installed!"
@@ -379,33 +379,189 @@ update_system() {
     sudo apt-get upgrade --fix-missing -y -o Dpkg::Options::="--force-confnew"
 }
 
+# Inputs an init script depends on besides its own content
+init_script_inputs() {
+    case "$1" in
+    background.sh) echo "$PLAYER_INIT_SCRIPTS_DIR"/*.jpg ;;
+    # re-run when the API code or its requirements change, to reinstall and restart it
+    health-check-api.sh) echo "$ORANGEAD_ROOT_DIR/oaDeviceAPI/requirements.txt $(git -C "$ORANGEAD_ROOT_DIR/oaDeviceAPI" rev-parse HEAD 2>/dev/null)" ;;
+    # keeps checking for browser updates once a day
+    chromium.sh) date +%F ;;
+    esac
+}
+
+run_init_script() {
+    local script=$1
+    local name=$(basename "$script")
+    local relative_path="${script#$PLAYER_ROOT_DIR/}"
+    local stamp=$(compute_stamp "$script" $(init_script_inputs "$name"))
+    if stamp_is_current "init-$name" "$stamp"; then
+        echo "Skipping $relative_path (unchanged since last run)"
+        return 0
+    fi
+    echo "Executing $relative_path..."
+    "$script" && write_stamp "init-$name" "$stamp"
+}
+
+# Init scripts that don't depend on each other and wait for the dpkg lock, so
+# they can run side by side. firewall.sh stays serial, its apt update would
+# race the installs for the apt locks.
+PARALLEL_INIT_SCRIPTS=(background.sh jq.sh unclutter.sh)
+
+# Runs all init scripts, or only those whose file names are given
 install_required_packages() {
     print_section "INSTALLING REQUIRED PACKAGES"
+    local requested=" $* "
+    local parallel_scripts=()
+    local serial_scripts=()
     for script in "$PLAYER_INIT_SCRIPTS_DIR"/*.sh; do
+        if [ $# -gt 0 ] && [[ "$requested" != *" $(basename "$script") "* ]]; then
+            continue
+        fi
         if [ -f "$script" ] && [ -x "$script" ]; then
-            local relative_path="${script#$PLAYER_ROOT_DIR/}"
-            echo "Executing $relative_path..."
-            "$script"
+            if [[ " ${PARALLEL_INIT_SCRIPTS[*]} " == *" $(basename "$script") "* ]]; then
+                parallel_scripts+=("$script")
+            else
+                serial_scripts+=("$script")
+            fi
         fi
     done
+
+    # Buffer the output of the concurrent scripts and print it in order
+    local pids=()
+    local outputs=()
+    for script in "${parallel_scripts[@]}"; do
+        local output=$(mktemp)
+        run_init_script "$script" >"$output" 2>&1 &
+        pids+=($!)
+        outputs+=("$output")
+    done
+    for i in "${!pids[@]}"; do
+        wait "${pids[$i]}"
+        cat "${outputs[$i]}"
+        rm -f "${outputs[$i]}"
+    done
+
+    for script in "${serial_scripts[@]}"; do
+        run_init_script "$script"
+    done
 }
 
+# Inputs a setup step depends on besides its own code
+step_inputs() {
+    case "$1" in
+    # besides their code, steps are keyed on the live state they edit, which
+    # apt upgrades (--force-confnew), the desktop or users can change back
+    configure_path) echo "$PLAYER_UTIL_SCRIPTS_DIR" ~/.bashrc ;;
+    schedule_auto_update_and_reboot) echo "$PLAYER_UTIL_SCRIPTS_DIR"; crontab -l 2>&1 ;;
+    set_timezone) readlink /etc/localtime ;;
+    configure_display) echo "$PLAYER_CONFIG_DIR/display.conf $PLAYER_UTIL_SCRIPTS_DIR/display.sh $PLAYER_UTIL_SCRIPTS_DIR/gnome-randr.py" ;;
+    configure_wifi) echo "$PLAYER_UTIL_SCRIPTS_DIR/wifi.sh" ;;
+    setup_systemd_services)
+        local service
+        echo "$PLAYER_ROOT_DIR $PLAYER_HELPER_SCRIPTS_DIR/service-utils.sh" "$PLAYER_SYSTEMD_DIR"/*.service
+        for service in "$PLAYER_SYSTEMD_DIR"/*.service; do
+            echo "/etc/systemd/system/$(basename "$service")"
+            systemctl is-enabled "$(basename "$service")" 2>&1
+        done
+        ;;
+    disable_update_notifications)
+        echo /etc/apt/apt.conf.d/{20auto-upgrades,10periodic,02-orangepi-periodic,99update-notifier,50unattended-upgrades}
+        echo /etc/default/orangepi-motd /etc/update-manager/release-upgrades /etc/update-manager/release-upgrades.d/ubuntu-advantage-upgrades.cfg
+        gsettings list-recursively com.ubuntu.update-notifier 2>&1
+        gsettings list-recursively com.ubuntu.update-manager 2>&1
+        gsettings get org.gnome.desktop.notifications application-children 2>&1
+        systemctl is-enabled update-notifier-download.timer update-notifier-motd.timer apt-daily.timer apt-daily-upgrade.timer ubuntu-advantage.service 2>&1
+        ;;
+    disable_gnome_notifications)
+        dconf dump /org/gnome/desktop/notifications/ 2>&1
+        gsettings list-recursively org.gnome.nm-applet 2>&1
+        ;;
+    configure_gnome_settings)
+        rfkill list bluetooth 2>&1
+        local schema
+        for schema in org.blueman.plugins.powermanager org.gnome.desktop.a11y.applications org.gnome.settings-daemon.plugins.power org.gnome.desktop.screensaver org.gnome.desktop.lockdown; do
+            gsettings list-recursively "$schema" 2>&1
+        done
+        ;;
+    # upgrade packages at most once a day
+    update_system) date +%F ;;
+    # keyring files get regenerated, the service can be disabled or stopped
+    cleanup_keyring_files) ls -A "$HOME/.local/share/keyrings" 2>/dev/null ;;
+    update_keyring_for_vnc) echo "$HOME/.local/share/keyrings/Default_keyring.keyring" ;;
+    enable_gnome_remote_desktop_service) systemctl --user is-enabled gnome-remote-desktop 2>&1; systemctl --user is-active gnome-remote-desktop 2>&1 ;;
+    enable_vnc) gsettings list-recursively org.gnome.desktop.remote-desktop.vnc 2>&1 ;;
+    esac
+}
+
+# Runs a step unless its code and inputs are unchanged since its last
+# successful run; init scripts are stamped one by one instead. The sudoers
+# file and the password can't be read back without root, so those two cheap,
+# idempotent steps always run.
+run_step() {
+    local step=$1
+    shift
+    case "$step" in
+    install_required_packages | configure_sudo_rights | change_default_password)
+        "$step" "$@"
+        return
+        ;;
+    esac
+    local stamp=$(compute_stamp "$(declare -f "$step")" $(step_inputs "$step"))
+    if stamp_is_current "$step" "$stamp"; then
+        echo "Skipping $step (unchanged since last run)"
+        return 0
+    fi
+    # stamp the state the step left behind, so a step that fixes up live
+    # state is not re-run just because it changed it
+    "$step" && write_stamp "$step" "$(compute_stamp "$(declare -f "$step")" $(step_inputs "$step"))"
+}
+
+SETUP_STEPS=(
+    configure_sudo_rights
+    configure_path
+    change_default_password
+    set_timezone
+    configure_display
+    configure_wifi
+    schedule_auto_update_and_reboot
+    setup_systemd_services
+    disable_update_notifications
+    disable_gnome_notifications
+    configure_gnome_settings
+    cleanup_keyring_files
+    update_keyring_for_vnc
+    enable_gnome_remote_desktop_service
+    enable_vnc
+    update_system
+    install_required_packages
+)
+
 # Main Execution
-configure_sudo_rights
-configure_path
-change_default_password
-set_timezone
-configure_display
-configure_wifi
-schedule_auto_update_and_reboot
-setup_systemd_services
-disable_update_notifications
-disable_gnome_notifications
-configure_gnome_settings
-cleanup_keyring_files
-update_keyring_for_vnc
-enable_gnome_remote_desktop_service
-enable_vnc
-update_system
-install_required_packages
+# Without arguments every step runs. Otherwise only the given steps and init
+# scripts (by file name, e.g. firewall.sh) run, still in the order above.
+# Steps whose stamp is unchanged are skipped unless --force is given.
+steps=()
+init_scripts=()
+for arg in "$@"; do
+    if [ "$arg" = "--force" ]; then
+        SETUP_FORCE=true
+    elif [[ "$arg" == *.sh ]]; then
+        init_scripts+=("$arg")
+        steps+=("$arg")
+    elif [[ " ${SETUP_STEPS[*]} " == *" $arg "* ]]; then
+        steps+=("$arg")
+    else
+        echo "Unknown setup step: $arg"
+        exit 1
+    fi
+done
+
+for step in "${SETUP_STEPS[@]}"; do
+    if [ ${#steps[@]} -eq 0 ] || [[ " ${steps[*]} " == *" $step "* ]]; then
+        run_step "$step"
+    elif [ "$step" = "install_required_packages" ] && [ ${#init_scripts[@]} -gt 0 ]; then
+        run_step "$step" "${init_scripts[@]}"
+    fi
+done
 print_section "SETUP COMPLETED"
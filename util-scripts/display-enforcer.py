@@ -0,0 +1,209 @@
+#!/bin/env python3
+
+# Keep the display configured as described in config/display.conf.
+#
+# Listens for DRM connector uevents and Mutter's MonitorsChanged signal,
+# waits for a burst of events to settle, then re-applies the mode
+# `gnome-randr.py --policy` would pick to the output if it drifted from it,
+# through the same apply queue. Re-applies that are needed again right
+# after the previous one (a flapping panel) or that fail are backed off
+# exponentially so Mutter is not hammered.
+
+import sys, os, time, signal, socket
+import dbus  # type: ignore
+import dbus.mainloop.glib  # type: ignore
+from gi.repository import GLib  # type: ignore
+from randr_loader import load_gnome_randr
+
+# kernel uevent multicast group
+NETLINK_KOBJECT_UEVENT = 15
+
+# quiet time after the last event before the config is checked
+DEBOUNCE_MS = 300
+# a re-apply needed within the backoff plus this many seconds of the last one
+# counts as a failure
+FLAP_WINDOW = 5.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+def log(str):
+    print("{} - {}".format(time.strftime("%Y-%m-%d %H:%M:%S"), str), flush=True)
+
+
+randr = load_gnome_randr()
+
+
+def open_uevent_socket():
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    sock.bind((0, 1))
+    sock.setblocking(False)
+    return sock
+
+
+def parse_uevent(data):
+    # "<action>@<devpath>\0KEY=VALUE\0..."
+    fields = data.split(b"\0")
+    event = dict()
+    for field in fields[1:]:
+        if b"=" in field:
+            key, value = field.split(b"=", 1)
+            event[key.decode(errors="replace")] = value.decode(errors="replace")
+    return event
+
+
+def output_drift(config_info, sel, policy):
+    # returns the settings of the selected output that differ from the selection
+    if not sel.output in config_info.output_config:
+        return ["enabled"]
+
+    conf = config_info.output_config[sel.output]
+    drift = []
+    if conf["res"] == "off" or conf["mode-info"][0] != sel.mode[0]:
+        drift.append("mode")
+    if abs(conf["scale"] - sel.scale) >= randr.SCALE_TOLERANCE:
+        drift.append("scale")
+    if policy.trans is not None and conf["trans"] != policy.trans:
+        drift.append("trans")
+    return drift
+
+
+class Enforcer:
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.policy = None
+        self.config_mtime = None
+        self.timer = None
+        self.failures = 0
+        self.last_apply = None
+
+        self.reload()
+
+        bus = dbus.SessionBus()
+        dc = bus.get_object("org.gnome.Mutter.DisplayConfig", "/org/gnome/Mutter/DisplayConfig")
+        self.dc_iface = dbus.Interface(dc, dbus_interface="org.gnome.Mutter.DisplayConfig")
+        self.dc_iface.connect_to_signal("MonitorsChanged", self.on_monitors_changed)
+
+        self.uevent_sock = open_uevent_socket()
+        GLib.io_add_watch(self.uevent_sock.fileno(), GLib.IO_IN, self.on_uevent)
+
+    def reload(self, changed_only=False):
+        try:
+            mtime = os.stat(self.config_file).st_mtime
+            if changed_only and mtime == self.config_mtime:
+                return
+            display_conf = randr.load_display_conf(self.config_file)
+            policy = randr.ModePolicy(display_conf)
+        except (OSError, ValueError, SystemExit) as e:
+            # keep enforcing the last good config rather than exiting on a bad
+            # or half-written edit; the mtime is left alone so it is retried
+            if not self.policy:
+                raise
+            reason = "invalid value" if isinstance(e, SystemExit) else e
+            log("could not load {} ({}), keeping the previous config".format(self.config_file, reason))
+            return
+        self.policy = policy
+        self.config_mtime = mtime
+        log("desired config: {}".format(display_conf))
+
+    def backoff(self):
+        # minimum time between two applies, grows while the panel keeps flapping
+        return min(BACKOFF_BASE * 2**self.failures, BACKOFF_MAX)
+
+    def schedule(self, delay_ms=DEBOUNCE_MS):
+        # every new event pushes the check back, so a burst is handled once
+        if self.timer:
+            GLib.source_remove(self.timer)
+        self.timer = GLib.timeout_add(delay_ms, self.on_timer)
+
+    def on_uevent(self, fd, condition):
+        try:
+            while True:
+                event = parse_uevent(self.uevent_sock.recv(8192))
+                if event.get("SUBSYSTEM") == "drm" and event.get("HOTPLUG") == "1":
+                    log("drm hotplug on {}".format(event.get("DEVNAME", "?")))
+                    self.schedule()
+        except BlockingIOError:
+            pass
+        return True
+
+    def on_monitors_changed(self):
+        self.schedule()
+
+    def on_timer(self):
+        self.timer = None
+        if self.last_apply is not None:
+            wait = self.last_apply + self.backoff() - time.monotonic()
+            if wait > 0:
+                self.schedule(int(wait * 1000))
+                return False
+        try:
+            self.enforce()
+        except dbus.exceptions.DBusException as e:
+            # mutter may be restarting, the next MonitorsChanged will retrigger
+            log("display config unavailable: {}".format(e.get_dbus_message()))
+        return False
+
+    def enforce(self):
+        # pick up edits (e.g. from oadisplay) before the old config is put back
+        self.reload(changed_only=True)
+
+        serial, monitors, logical_monitors, properties = self.dc_iface.GetCurrentState()
+        config_info = randr.ConfigInfo(serial, monitors, logical_monitors, properties)
+
+        requested_actions = randr.ActionRequest()
+        sel = randr.apply_policy(config_info, self.policy, requested_actions)
+        if not sel:
+            log("no display connected")
+            return
+        if not sel.mode:
+            log("; ".join(sel.reasons))
+            return
+
+        drift = output_drift(config_info, sel, self.policy)
+        if not drift:
+            return
+        output = sel.output
+
+        now = time.monotonic()
+        if self.last_apply is not None and now - self.last_apply < self.backoff() + FLAP_WINDOW:
+            self.failures += 1
+        else:
+            self.failures = 0
+        self.last_apply = now
+
+        log("{} drifted ({}), re-applying".format(output, ", ".join(drift)))
+        # go through the shared queue so a concurrent display.sh or oadisplay
+        # run is coalesced with this one instead of racing it on the serial;
+        # the policy is re-evaluated against the state read right before the apply
+        request = randr.ActionRequest()
+        request.policy = self.policy
+        result = randr.queue_apply(self.dc_iface, request, randr.Profiler())
+        if result["status"] == "failed":
+            self.failures += 1
+            log("apply failed: {}, retrying in {:.0f}s".format(result.get("message"), self.backoff()))
+            self.schedule(int(self.backoff() * 1000))
+
+
+def main():
+    config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "config", "display.conf")
+    if len(sys.argv) > 1:
+        config_file = sys.argv[1]
+
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    enforcer = Enforcer(config_file)
+
+    def on_sighup():
+        enforcer.reload()
+        enforcer.schedule()
+        return True
+
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP, on_sighup)
+
+    # bring the display in line once at startup
+    enforcer.schedule(0)
+    GLib.MainLoop().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/bin/env python3
+
+# Check a display.conf against saved GetCurrentState snapshots (as written by
+# `gnome-randr.py --save-state`) and report, per device, whether display.sh
+# would apply the config as is, fall back, or find nothing usable.
+# The mode selection is the one `gnome-randr.py --policy` makes on the device.
+# Since it falls back to the monitor's own preferred mode as a last resort,
+# "unsupported" only means there is no usable output at all (none connected,
+# OUTPUT missing, or no modes); anything display.sh can still set up is
+# reported as "fallback" with the reasons.
+
+import sys, os, io, json
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from randr_loader import load_gnome_randr
+
+randr = None
+policy = None
+
+
+def fatal(str):
+    print(str, file=sys.stderr)
+    quit(1)
+
+
+def usage():
+    print(
+        "usage: {} <snapshot-dir> [options]\n"
+        "\twhere options are:\n"
+        "\t--config <display.conf>\n"
+        "\t--jobs <n>\n"
+        "\tstatus is apply, fallback, unsupported (no usable output) or error\n".format(os.path.basename(sys.argv[0]))
+    )
+    quit()
+
+
+def init_worker(display_conf):
+    global randr, policy
+    randr = load_gnome_randr()
+    policy = randr.ModePolicy(display_conf)
+
+
+def validate_state(state):
+    serial, monitors, logical_monitors, properties = state
+    config_info = randr.ConfigInfo(serial, monitors, logical_monitors, properties)
+
+    requested_actions = randr.ActionRequest()
+    sel = randr.apply_policy(config_info, policy, requested_actions)
+    if not sel:
+        return {"status": "unsupported", "reasons": ["no display connected"]}
+    if not sel.mode:
+        return {"status": "unsupported", "output": sel.output, "reasons": sel.reasons}
+
+    config_info.update_output_config(requested_actions)
+    new_lm = randr.monmap_to_lm(config_info, config_info.monmap)
+
+    return {
+        "status": "fallback" if sel.fallback or config_info.warnings else "apply",
+        "output": sel.output,
+        "mode": sel.mode[0],
+        "scale": sel.scale,
+        "changed": config_info.config_changed(new_lm),
+        "reasons": sel.reasons + config_info.warnings,
+    }
+
+
+def validate_snapshot(path):
+    result = {"device": os.path.splitext(os.path.basename(path))[0]}
+    # gnome-randr reports through print(), keep that out of the ndjson stream
+    with redirect_stdout(io.StringIO()):
+        try:
+            result.update(validate_state(randr.load_state(path)))
+        except (Exception, SystemExit) as e:
+            result.update({"status": "error", "reasons": ["{}: {}".format(type(e).__name__, e)]})
+    return result["status"], json.dumps(result)
+
+
+def main():
+    snapshot_dir = None
+    config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "config", "display.conf")
+    jobs = os.cpu_count()
+
+    n = 1
+    while n < len(sys.argv):
+        arg = sys.argv[n]
+        n += 1
+
+        if arg == "-h" or arg == "--help":
+            usage()
+        elif arg == "--config":
+            if n >= len(sys.argv):
+                fatal("{} requires an argument".format(arg))
+            config_file = sys.argv[n]
+            n += 1
+        elif arg == "--jobs":
+            if n >= len(sys.argv):
+                fatal("{} requires an argument".format(arg))
+            jobs = int(sys.argv[n])
+            n += 1
+        elif not snapshot_dir:
+            snapshot_dir = arg
+        else:
+            fatal("unrecognized option: {}".format(arg))
+
+    if not snapshot_dir:
+        usage()
+
+    display_conf = load_gnome_randr().load_display_conf(config_file)
+    # a malformed config fails here once rather than in every worker
+    load_gnome_randr().ModePolicy(display_conf)
+    paths = sorted(os.path.join(snapshot_dir, f) for f in os.listdir(snapshot_dir) if f.endswith(".json"))
+    if not paths:
+        fatal("no snapshots found in {}".format(snapshot_dir))
+
+    counts = dict()
+    # large chunks keep the per-task IPC overhead well below the work itself
+    chunksize = max(1, len(paths) // (jobs * 8))
+    with Pool(jobs, initializer=init_worker, initargs=(display_conf,)) as pool:
+        for status, line in pool.imap_unordered(validate_snapshot, paths, chunksize):
+            sys.stdout.write(line + "\n")
+            counts[status] = counts.get(status, 0) + 1
+
+    print(" ".join("{}: {}".format(k, v) for k, v in sorted(counts.items())), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 #!/bin/env python3
 
-import sys, os, dbus  # type: ignore
+import sys, os, time, json
+from math import gcd
 from collections import defaultdict
+from contextlib import contextmanager, ExitStack
+
+# taken as early as possible so python startup can be told apart from the rest
+START_TIME = time.monotonic()
 
 # from stackoverflow.com/questions/5369723
 nested_dict = lambda: defaultdict(nested_dict)
 
+SCALE_TOLERANCE = 0.01
+
 
 def fatal(str):
     print(str)
@@ -23,6 +30,11 @@ def usage():
         "\t--current\n"
         "\t--dry-run\n"
         "\t--persistent\n"
+        "\t--save-state <file>\n"
+        "\t--policy <display.conf>\n"
+        "\t--profile\n"
+        "\t--profile-file <file>\n"
+        "\t--cprofile <file>\n"
         "\t--global-scale <global-scale>\n"
         "\t--output <output>\n"
         "\t\t--auto\n"
@@ -55,10 +67,14 @@ def get_mode_by_id(mode_id, monitor):
 
 
 def mode_has_rate(res, rate, monitor):
+    # of the modes rounding to the same rate, e.g. 60 and 59.94, take the closest
+    match = None
     for md in monitor[1]:
         res_str = "{}x{}".format(md[1], md[2])
         if res_str == res and round(md[3]) == round(rate):
-            return md
+            if not match or abs(md[3] - rate) < abs(match[3] - rate):
+                match = md
+    return match
 
 
 def get_pref_mode(monitor):
@@ -74,8 +90,9 @@ def get_current_mode(monitor):
 
 
 def has_scale(scale, mode):
+    # supported scales are floats like 1.7518248558044434, compare loosely
     for s in mode[5]:
-        if s == scale:
+        if abs(s - scale) < SCALE_TOLERANCE:
             return s
 
 
@@ -433,15 +450,180 @@ def monmap_to_lm(config_info, monmap):
     return new_lm
 
 
+def conf_float(display_conf, key, default=None):
+    value = display_conf.get(key)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        fatal("invalid {} {}, expected a number".format(key, value))
+
+
+class ModePolicy:
+    def __init__(self, display_conf):
+        # kept to hand the policy to the apply queue
+        self.display_conf = display_conf
+        # defaults reproduce what display.sh used to hard-code
+        self.output = display_conf.get("OUTPUT") or None
+        self.resolutions = [display_conf.get("PREFERRED_RESOLUTION", "auto")]
+        self.resolutions += display_conf.get("FALLBACK_RESOLUTIONS", "1920x1080").replace(",", " ").split()
+        self.rate = conf_float(display_conf, "PREFERRED_RATE")
+        self.rate_tolerance = conf_float(display_conf, "RATE_TOLERANCE", 0.5)
+        self.scale = conf_float(display_conf, "SCALE", 1.0)
+        self.fallback_scale = conf_float(display_conf, "FALLBACK_SCALE", 1.0)
+        self.aspect = None
+        aspect = display_conf.get("ASPECT")
+        if not aspect and "x" in self.resolutions[0]:
+            aspect = self.resolutions[0].replace("x", ":")
+        if aspect:
+            try:
+                w, h = [int(v) for v in aspect.split(":")]
+            except ValueError:
+                fatal("invalid ASPECT {}, expected <width>:<height> (e.g. 16:9)".format(aspect))
+            if w <= 0 or h <= 0:
+                fatal("invalid ASPECT {}, expected <width>:<height> (e.g. 16:9)".format(aspect))
+            self.aspect = (w // gcd(w, h), h // gcd(w, h))
+        self.trans = rot_to_trans(display_conf["ROTATE"]) if display_conf.get("ROTATE") else None
+
+
+class ModeSelection:
+    def __init__(self, output):
+        self.output = output
+        self.mode = None
+        self.scale = None
+        # true as soon as anything other than the first preference was picked
+        self.fallback = False
+        self.reasons = []
+
+    def reason(self, str, fallback=False):
+        self.reasons.append(str)
+        if fallback:
+            self.fallback = True
+
+
+def index_modes(monitor):
+    # resolution -> modes, in one pass over the monitor's mode list
+    table = defaultdict(list)
+    for md in monitor[1]:
+        table["{}x{}".format(md[1], md[2])].append(md)
+    return table
+
+
+def select_mode(output, monitor, policy):
+    sel = ModeSelection(output)
+    table = index_modes(monitor)
+    pref_mode = get_pref_mode(monitor)
+
+    res = None
+    first_choice = False
+    for n, candidate in enumerate(policy.resolutions):
+        if candidate == "auto" and pref_mode:
+            candidate = "{}x{}".format(pref_mode[1], pref_mode[2])
+        if candidate in table:
+            res = candidate
+            first_choice = n == 0
+            if first_choice:
+                sel.reason("resolution {} is available".format(res))
+            else:
+                sel.reason("{} not available, using fallback {}".format(policy.resolutions[0], res), True)
+            break
+
+    if not res and policy.aspect:
+        aw, ah = policy.aspect
+        matching = [r for r, mds in table.items() if abs(mds[0][1] * ah - mds[0][2] * aw) <= 0.01 * mds[0][2] * aw]
+        if matching:
+            res = max(matching, key=lambda r: table[r][0][1] * table[r][0][2])
+            sel.reason("no listed resolution available, using largest {}:{} mode {}".format(aw, ah, res), True)
+
+    if not res and pref_mode:
+        res = "{}x{}".format(pref_mode[1], pref_mode[2])
+        sel.reason("no listed resolution available, using the monitor's preferred {}".format(res), True)
+
+    if not res:
+        sel.reason("no modes available for output {}".format(output), True)
+        return sel
+
+    modes = table[res]
+    if policy.rate is None:
+        if pref_mode in modes:
+            sel.mode = pref_mode
+        else:
+            sel.mode = max(modes, key=lambda md: md[3])
+        sel.reason("no rate requested, using {:.2f}".format(sel.mode[3]))
+    else:
+        sel.mode = min(modes, key=lambda md: abs(md[3] - policy.rate))
+        if abs(sel.mode[3] - policy.rate) <= policy.rate_tolerance:
+            sel.reason("rate {:.2f} is within {} of {}".format(sel.mode[3], policy.rate_tolerance, policy.rate))
+        else:
+            sel.reason("rate {} not available at {}, nearest is {:.2f}".format(policy.rate, res, sel.mode[3]), True)
+
+    # a fallback resolution gets the fallback scale, like display.sh did
+    scales = [policy.scale, policy.fallback_scale] if first_choice else [policy.fallback_scale]
+    for scale in scales:
+        sel.scale = has_scale(scale, sel.mode)
+        if sel.scale:
+            break
+
+    if not sel.scale:
+        sel.scale = sel.mode[4]
+        sel.reason("none of the scales {} supported at {}, using preferred {}".format(scales, res, sel.scale), True)
+    elif not first_choice:
+        sel.reason("using fallback scale {} with fallback resolution".format(scale))
+    elif scale == policy.scale:
+        sel.reason("scale {} is supported".format(scale))
+    else:
+        sel.reason("scale {} not supported at {}, using {}".format(policy.scale, res, scale), True)
+
+    return sel
+
+
+def get_first_output(monitors, logical_monitors):
+    # first physical monitor of the first logical monitor, or any connected
+    # monitor if none is enabled
+    for lm in logical_monitors:
+        for m in lm[5]:
+            return m[0]
+    for m in monitors:
+        return m[0][0]
+
+
+def apply_policy(config_info, policy, requested_actions):
+    output = policy.output or get_first_output(config_info.monitors, config_info.logical_monitors)
+    if not output:
+        return None
+
+    monitor = config_info.get_monitor_by_output(output)
+    if not monitor:
+        sel = ModeSelection(output)
+        sel.reason("output {} does not exist".format(output), True)
+        return sel
+
+    sel = select_mode(output, monitor, policy)
+    if sel.mode:
+        conf = requested_actions.output_config[output]
+        conf["res"] = "{}x{}".format(sel.mode[1], sel.mode[2])
+        conf["rate"] = sel.mode[3]
+        conf["scale"] = sel.scale
+        if policy.trans is not None:
+            conf["trans"] = policy.trans
+    return sel
+
+
 class ActionRequest:
     def __init__(self):
         self.print_current = False
         self.dry_run = False
+        self.save_state = None
+        self.policy = None
         # 1: temporary, 2: persistent
         self.config_method = 1
         self.global_scale = None
         self.primary = None
         self.output_config = nested_dict()
+        # "-" writes to stderr, anything else is a file the record is appended to
+        self.profile = profile_dest(os.environ.get("GNOME_RANDR_PROFILE", ""))
+        self.cprofile = profile_dest(os.environ.get("GNOME_RANDR_CPROFILE", ""))
 
 
 class ConfigInfo:
@@ -504,12 +686,18 @@ class ConfigInfo:
 
     def __init__(self, serial, monitors, logical_monitors, properties):
         self.serial = serial
+        # requested settings that could not be applied, in the order they were hit
+        self.warnings = []
         self.monitors = monitors
         self.logical_monitors = logical_monitors
         self.__init_properties(properties)
         self.__init_output_config(monitors, logical_monitors)
         self.monmap = get_monmap(monitors, logical_monitors)
 
+    def warn(self, str):
+        self.warnings.append(str)
+        warn(str)
+
     def set_output_defaults(self, output, monitor):
         conf = self.output_config[output]
         conf["monitor"] = monitor
@@ -525,7 +713,7 @@ class ConfigInfo:
         for out, conf in requested_actions.output_config.items():
             monitor = self.get_monitor_by_output(out)
             if not monitor:
-                warn("output {} does not exist".format(out))
+                self.warn("output {} does not exist".format(out))
                 continue
 
             if not out in self.output_config:
@@ -569,7 +757,7 @@ class ConfigInfo:
         if rel_conf and rel_conf["res"] != "off":
             monmap_move_output(self.monmap, output, rel_out, relation[0])
         else:
-            warn("{} can't be relative to disabled or unavailable output {}".format(output, rel_out))
+            self.warn("{} can't be relative to disabled or unavailable output {}".format(output, rel_out))
 
     def output_set_trans(self, output, trans):
         conf = self.output_config[output]
@@ -590,10 +778,11 @@ class ConfigInfo:
         if conf["res"] == "off":
             return
 
-        if has_scale(scale, conf["mode-info"]):
-            conf["scale"] = scale
+        supported = has_scale(scale, conf["mode-info"])
+        if supported:
+            conf["scale"] = supported
         else:
-            warn("scale {} not available for output {}@{}".format(scale, output, conf["res"]))
+            self.warn("scale {} not available for output {}@{}".format(scale, output, conf["res"]))
 
     def output_set_rate(self, output, rate):
         conf = self.output_config[output]
@@ -608,7 +797,7 @@ class ConfigInfo:
             conf["mode-info"] = new_mode
             conf["rate"] = rate
         else:
-            warn("rate {} not available for output {}@{}".format(rate, output, conf["res"]))
+            self.warn("rate {} not available for output {}@{}".format(rate, output, conf["res"]))
 
     def output_set_mode_by_res(self, output, res):
         conf = self.output_config[output]
@@ -636,7 +825,7 @@ class ConfigInfo:
             if old_res == "off":
                 monmap_add_output_next_free(self.monmap, output)
         else:
-            warn("mode {} not available for output {}".format(res, output))
+            self.warn("mode {} not available for output {}".format(res, output))
 
     def get_monitor_by_output(self, output):
         for m in self.monitors:
@@ -717,128 +906,510 @@ def print_new_config(logical_monitors):
         print()
 
 
-requested_actions = ActionRequest()
-
-config_output = None
-n = 1
-while n < len(sys.argv):
-    arg = sys.argv[n]
-    n += 1
-
-    if arg == "-h" or arg == "--help":
-        usage()
-    elif arg == "--current":
-        requested_actions.print_current = True
-    elif arg == "--dry-run":
-        requested_actions.dry_run = True
-    elif arg == "--persistent":
-        requested_actions.config_method = 2
-    elif arg == "--global-scale":
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.global_scale = float(sys.argv[n])
-        n += 1
-    elif arg == "--output":
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        config_output = sys.argv[n]
-        n += 1
-    elif arg == "--auto":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        requested_actions.output_config[config_output]["res"] = "auto"
-    elif arg == "--mode":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["res"] = sys.argv[n]
-        n += 1
-    elif arg == "--rate":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["rate"] = float(sys.argv[n])
-        n += 1
-    elif arg == "--scale":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["scale"] = float(sys.argv[n])
-        n += 1
-    elif arg == "--off":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        requested_actions.output_config[config_output]["res"] = "off"
-    elif arg == "--right-of":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["relation"] = ("right-of", sys.argv[n])
-        n += 1
-    elif arg == "--left-of":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["relation"] = ("left-of", sys.argv[n])
-        n += 1
-    elif arg == "--above":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["relation"] = ("above", sys.argv[n])
-        n += 1
-    elif arg == "--below":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["relation"] = ("below", sys.argv[n])
-        n += 1
-    elif arg == "--same-as":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["relation"] = ("same-as", sys.argv[n])
-        n += 1
-    elif arg == "--rotate":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        if n >= len(sys.argv):
-            fatal("{} requires an argument".format(arg))
-        requested_actions.output_config[config_output]["trans"] = rot_to_trans(sys.argv[n])
+def parse_args(argv):
+    requested_actions = ActionRequest()
+
+    config_output = None
+    n = 1
+    while n < len(argv):
+        arg = argv[n]
         n += 1
-    elif arg == "--primary":
-        if not config_output:
-            fatal("{} must be used after --output".format(arg))
-        requested_actions.primary = config_output
+
+        if arg == "-h" or arg == "--help":
+            usage()
+        elif arg == "--current":
+            requested_actions.print_current = True
+        elif arg == "--dry-run":
+            requested_actions.dry_run = True
+        elif arg == "--persistent":
+            requested_actions.config_method = 2
+        elif arg == "--save-state":
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.save_state = argv[n]
+            n += 1
+        elif arg == "--policy":
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.policy = ModePolicy(load_display_conf(argv[n]))
+            n += 1
+        elif arg == "--profile":
+            if not requested_actions.profile:
+                requested_actions.profile = "-"
+        elif arg == "--profile-file":
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.profile = argv[n]
+            n += 1
+        elif arg == "--cprofile":
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.cprofile = argv[n]
+            n += 1
+        elif arg == "--global-scale":
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.global_scale = float(argv[n])
+            n += 1
+        elif arg == "--output":
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            config_output = argv[n]
+            n += 1
+        elif arg == "--auto":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            requested_actions.output_config[config_output]["res"] = "auto"
+        elif arg == "--mode":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["res"] = argv[n]
+            n += 1
+        elif arg == "--rate":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["rate"] = float(argv[n])
+            n += 1
+        elif arg == "--scale":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["scale"] = float(argv[n])
+            n += 1
+        elif arg == "--off":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            requested_actions.output_config[config_output]["res"] = "off"
+        elif arg == "--right-of":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["relation"] = ("right-of", argv[n])
+            n += 1
+        elif arg == "--left-of":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["relation"] = ("left-of", argv[n])
+            n += 1
+        elif arg == "--above":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["relation"] = ("above", argv[n])
+            n += 1
+        elif arg == "--below":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["relation"] = ("below", argv[n])
+            n += 1
+        elif arg == "--same-as":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["relation"] = ("same-as", argv[n])
+            n += 1
+        elif arg == "--rotate":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            if n >= len(argv):
+                fatal("{} requires an argument".format(arg))
+            requested_actions.output_config[config_output]["trans"] = rot_to_trans(argv[n])
+            n += 1
+        elif arg == "--primary":
+            if not config_output:
+                fatal("{} must be used after --output".format(arg))
+            requested_actions.primary = config_output
+        else:
+            fatal("unrecognized option: {}".format(arg))
+
+    return requested_actions
+
+
+def save_state(path, state):
+    # dbus types subclass the python builtins, so the reply serializes as is
+    with open(path, "w") as f:
+        json.dump(list(state), f)
+
+
+def load_state(path):
+    with open(path) as f:
+        serial, monitors, logical_monitors, properties = json.load(f)
+    return serial, monitors, logical_monitors, properties
+
+
+def load_display_conf(path):
+    # display.conf is sourced by the shell scripts, so only plain KEY=VALUE
+    # lines are understood here
+    conf = dict()
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            value = value.split(" #", 1)[0].strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]
+            conf[key.strip()] = value
+    return conf
+
+
+def process_age():
+    # seconds since the kernel started this process, read from /proc so the
+    # interpreter startup before the first line of this script is accounted for
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def dbus_payload_size(value):
+    # approximate marshalled size of a dbus value, ignoring alignment padding
+    type_name = type(value).__name__
+    if type_name == "Byte":
+        return 1
+    if type_name in ["Int16", "UInt16"]:
+        return 2
+    if type_name in ["Int64", "UInt64", "Double"] or isinstance(value, float):
+        return 8
+    if isinstance(value, (bool, int)):
+        return 4
+    if isinstance(value, str):
+        return 4 + len(value.encode("utf-8")) + 1
+    if isinstance(value, dict):
+        return 4 + sum(dbus_payload_size(k) + dbus_payload_size(v) for k, v in value.items())
+    if type_name == "Struct" or isinstance(value, tuple):
+        return sum(dbus_payload_size(v) for v in value)
+    if isinstance(value, list):
+        return 4 + sum(dbus_payload_size(v) for v in value)
+    return 0
+
+
+class Profiler:
+    def __init__(self):
+        self.stages = dict()
+        self.dbus_calls = defaultdict(int)
+        self.dbus_bytes_sent = 0
+        self.dbus_bytes_received = 0
+
+        age = process_age()
+        if age is not None:
+            # the process age is read after START_TIME, so take that back out
+            self.stages["python-startup"] = max(0.0, age - (time.monotonic() - START_TIME))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start
+
+    def count_dbus_call(self, method, args, reply):
+        self.dbus_calls[method] += 1
+        self.dbus_bytes_sent += dbus_payload_size(tuple(args))
+        self.dbus_bytes_received += dbus_payload_size(reply)
+
+    def record(self, argv):
+        return {
+            "time": time.time(),
+            "pid": os.getpid(),
+            "argv": argv[1:],
+            "stages": self.stages,
+            "total": self.stages.get("python-startup", 0.0) + time.monotonic() - START_TIME,
+            "dbus": {
+                "calls": sum(self.dbus_calls.values()),
+                "methods": dict(self.dbus_calls),
+                "bytes-sent": self.dbus_bytes_sent,
+                "bytes-received": self.dbus_bytes_received,
+            },
+        }
+
+    def emit(self, dest, argv):
+        line = json.dumps(self.record(argv), sort_keys=False) + "\n"
+        if dest == "-":
+            sys.stderr.write(line)
+        else:
+            with open(dest, "a") as f:
+                f.write(line)
+
+
+class DBusCallCounter:
+    def __init__(self, iface, profiler):
+        self.iface = iface
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        method = getattr(self.iface, name)
+
+        def call(*args, **kwargs):
+            reply = method(*args, **kwargs)
+            self.profiler.count_dbus_call(name, args, reply)
+            return reply
+
+        return call
+
+
+def profile_dest(value):
+    # switch-like values enable or disable, anything else is a file path
+    if value.lower() in ["", "0", "no", "false"]:
+        return None
+    if value.lower() in ["1", "-", "stderr", "yes", "true"]:
+        return "-"
+    return value
+
+
+def connect_display_config(profiler):
+    with profiler.stage("import-dbus"):
+        import dbus  # type: ignore
+
+    with profiler.stage("bus-connect"):
+        bus = dbus.SessionBus()
+        dc = bus.get_object("org.gnome.Mutter.DisplayConfig", "/org/gnome/Mutter/DisplayConfig")
+        dc_iface = dbus.Interface(dc, dbus_interface="org.gnome.Mutter.DisplayConfig")
+
+    return DBusCallCounter(dc_iface, profiler)
+
+
+def apply_request(dc_iface, requested_actions, profiler):
+    with profiler.stage("get-current-state"):
+        serial, monitors, logical_monitors, properties = dc_iface.GetCurrentState()
+
+    if requested_actions.save_state:
+        save_state(requested_actions.save_state, (serial, monitors, logical_monitors, properties))
+
+    with profiler.stage("config-info"):
+        config_info = ConfigInfo(serial, monitors, logical_monitors, properties)
+    if requested_actions.policy:
+        with profiler.stage("select-mode"):
+            sel = apply_policy(config_info, requested_actions.policy, requested_actions)
+        if not sel:
+            fatal("no display connected")
+        for reason in sel.reasons:
+            print("{}: {}".format(sel.output, reason))
+        if not sel.mode:
+            fatal("no usable mode for output {}".format(sel.output))
+
+    with profiler.stage("update-output-config"):
+        config_info.update_output_config(requested_actions)
+
+    if len(requested_actions.output_config) == 0 or requested_actions.print_current == True:
+        config_info.print_properties()
+        config_info.print_current_config()
+        return "current"
+
+    with profiler.stage("monmap-to-lm"):
+        new_lm = monmap_to_lm(config_info, config_info.monmap)
+    print_new_config(new_lm)
+
+    if not requested_actions.dry_run and config_info.config_changed(new_lm):
+        with profiler.stage("apply-monitors-config"):
+            dc_iface.ApplyMonitorsConfig(config_info.serial, requested_actions.config_method, new_lm, {})
+        return "applied"
     else:
-        fatal("unrecognized option: {}".format(arg))
+        print("no changes made")
+        return "unchanged"
+
+
+def request_to_json(requested_actions):
+    return {
+        "config-method": requested_actions.config_method,
+        "global-scale": requested_actions.global_scale,
+        "primary": requested_actions.primary,
+        "output-config": requested_actions.output_config,
+        "policy": requested_actions.policy.display_conf if requested_actions.policy else None,
+    }
+
+
+def request_from_json(data):
+    requested_actions = ActionRequest()
+    requested_actions.config_method = data["config-method"]
+    requested_actions.global_scale = data["global-scale"]
+    requested_actions.primary = data["primary"]
+    for out, conf in data["output-config"].items():
+        for key, value in conf.items():
+            if key == "relation":
+                value = tuple(value)
+            requested_actions.output_config[out][key] = value
+    if data["policy"] is not None:
+        requested_actions.policy = ModePolicy(data["policy"])
+    return requested_actions
+
+
+def queue_dir():
+    # derived from the uid only: the callers don't agree on XDG_RUNTIME_DIR
+    # (the health API service doesn't set it) but must share one queue
+    runtime_dir = "/run/user/{}".format(os.getuid())
+    if os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "gnome-randr")
+    return "/tmp/gnome-randr-{}".format(os.getuid())
+
+
+@contextmanager
+def locked(path):
+    import fcntl
+
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    tmp_path = "{}.{}".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def apply_with_retry(dc_iface, requested_actions, profiler):
+    import dbus  # type: ignore
+
+    try:
+        return apply_request(dc_iface, requested_actions, profiler)
+    except dbus.exceptions.DBusException as e:
+        # a client outside the queue changed the config in between, one retry
+        # with the new serial is enough
+        if not "stale information" in (e.get_dbus_message() or ""):
+            raise
+        return apply_request(dc_iface, requested_actions, profiler)
+
+
+def request_kind(requested_actions):
+    # only requests of the same kind replace each other in the queue: same
+    # outputs, same config method, display.conf policy or not
+    return [sorted(requested_actions.output_config), requested_actions.config_method, requested_actions.policy is not None]
+
+
+def queue_apply(dc_iface, requested_actions, profiler):
+    # All clients (display.sh, the enforcer, oadisplay, the API) apply through
+    # here. A request replaces the last pending one if it is of the same kind
+    # and is queued behind it otherwise. Whoever holds the apply lock applies
+    # the pending requests in order, each against a freshly read serial, and
+    # records the result for every caller each of them covers.
+    qdir = queue_dir()
+    os.makedirs(qdir, exist_ok=True)
+    queue_lock = os.path.join(qdir, "queue.lock")
+    queue_path = os.path.join(qdir, "queue.json")
+    empty = {"next-seq": 1, "pending": [], "results": {}}
+
+    with locked(queue_lock):
+        queue = read_json(queue_path, empty)
+        seq = queue["next-seq"]
+        queue["next-seq"] += 1
+        kind = request_kind(requested_actions)
+        entry = {"seqs": [seq], "pid": os.getpid(), "kind": kind, "request": request_to_json(requested_actions)}
+        if queue["pending"] and queue["pending"][-1]["kind"] == kind:
+            entry["seqs"] = queue["pending"][-1]["seqs"] + entry["seqs"]
+            queue["pending"][-1] = entry
+        else:
+            queue["pending"].append(entry)
+        write_json(queue_path, queue)
 
-bus = dbus.SessionBus()
-dc = bus.get_object("org.gnome.Mutter.DisplayConfig", "/org/gnome/Mutter/DisplayConfig")
+    with ExitStack() as stack:
+        with profiler.stage("queue-wait"):
+            stack.enter_context(locked(os.path.join(qdir, "apply.lock")))
 
-dc_iface = dbus.Interface(dc, dbus_interface="org.gnome.Mutter.DisplayConfig")
-serial, monitors, logical_monitors, properties = dc_iface.GetCurrentState()
+        while True:
+            with locked(queue_lock):
+                queue = read_json(queue_path, empty)
+                if str(seq) in queue["results"]:
+                    return queue["results"][str(seq)]
+                if not queue["pending"]:
+                    # the process applying it died before recording a result
+                    return {"pid": os.getpid(), "status": "failed", "message": "request lost"}
+                entry = queue["pending"].pop(0)
+                write_json(queue_path, queue)
+
+            if entry["pid"] != os.getpid():
+                print("applying request from pid {}".format(entry["pid"]))
+            result = {"pid": os.getpid()}
+            try:
+                result["status"] = apply_with_retry(dc_iface, request_from_json(entry["request"]), profiler)
+            except (Exception, SystemExit) as e:
+                result["status"] = "failed"
+                result["message"] = str(e) if isinstance(e, Exception) else "see output of pid {}".format(os.getpid())
+
+            with locked(queue_lock):
+                queue = read_json(queue_path, empty)
+                for covered in entry["seqs"]:
+                    queue["results"][str(covered)] = result
+                # waiters collect their result right after the apply, keep
+                # only the recent ones
+                for old in [k for k in queue["results"] if int(k) < queue["next-seq"] - 256]:
+                    del queue["results"][old]
+                write_json(queue_path, queue)
+
+
+def run(requested_actions, profiler):
+    dc_iface = connect_display_config(profiler)
+
+    queued = len(requested_actions.output_config) > 0 or requested_actions.policy
+    if not queued or requested_actions.print_current or requested_actions.dry_run:
+        apply_request(dc_iface, requested_actions, profiler)
+        return
 
-config_info = ConfigInfo(serial, monitors, logical_monitors, properties)
-config_info.update_output_config(requested_actions)
+    result = queue_apply(dc_iface, requested_actions, profiler)
+    if result["pid"] != os.getpid():
+        print("request covered by pid {}: {}".format(result["pid"], result["status"]))
+    if result["status"] == "failed":
+        fatal("apply failed: {}".format(result.get("message")))
 
-if len(requested_actions.output_config) == 0 or requested_actions.print_current == True:
-    config_info.print_properties()
-    config_info.print_current_config()
-    quit()
 
-new_lm = monmap_to_lm(config_info, config_info.monmap)
-print_new_config(new_lm)
+def main():
+    profiler = Profiler()
+    with profiler.stage("parse-args"):
+        requested_actions = parse_args(sys.argv)
+
+    cprof = None
+    if requested_actions.cprofile:
+        import cProfile
+
+        cprof = cProfile.Profile()
+        cprof.enable()
+
+    try:
+        run(requested_actions, profiler)
+    finally:
+        if cprof:
+            cprof.disable()
+            if requested_actions.cprofile == "-":
+                import pstats
+
+                pstats.Stats(cprof, stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+            else:
+                cprof.dump_stats(requested_actions.cprofile)
+        if requested_actions.profile:
+            # make sure the record reflects everything printed so far
+            sys.stdout.flush()
+            profiler.emit(requested_actions.profile, sys.argv)
+
 
-if not requested_actions.dry_run and config_info.config_changed(new_lm):
-    dc_iface.ApplyMonitorsConfig(config_info.serial, requested_actions.config_method, new_lm, {})
-else:
-    print("no changes made")
+if __name__ == "__main__":
+    main()
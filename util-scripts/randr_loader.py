@@ -0,0 +1,18 @@
+# Shared loader for gnome-randr.py, whose dash keeps it from being imported
+# by name. Used by the sibling scripts that build on its config handling.
+
+import os, sys, importlib.util
+
+
+def load_gnome_randr():
+    # one module per process, however many callers ask for it
+    module = sys.modules.get("gnome_randr")
+    if module:
+        return module
+
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gnome-randr.py")
+    spec = importlib.util.spec_from_file_location("gnome_randr", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules["gnome_randr"] = module
+    return module
@@ -0,0 +1,272 @@
+#!/bin/env python3
+
+# Screenshot thumbnails for the health API.
+#
+# The screen is grabbed through gnome-shell's Screenshot D-Bus interface into
+# the runtime dir (tmpfs), then downscaled and JPEG encoded on a worker
+# thread. Thumbnails are cached for a few seconds, in memory for callers that
+# import this module and as files for the command line, so dashboards polling
+# many devices don't trigger a full capture on every request.
+
+import sys, os, time, json, threading
+from concurrent.futures import ThreadPoolExecutor
+from randr_loader import load_gnome_randr
+
+# already created by init-scripts/health-check-api.sh
+CACHE_DIR = "/tmp/screenshots"
+DEFAULT_TTL = 5.0
+DEFAULT_MAX_SIZE = 480
+DEFAULT_QUALITY = 70
+# the stage geometry is refreshed on MonitorsChanged, and after this long for
+# callers without a main loop to deliver the signal
+GEOMETRY_TTL = 30.0
+
+
+def fatal(str):
+    print(str, file=sys.stderr)
+    quit(1)
+
+
+def usage():
+    print(
+        "usage: {} [options]\n"
+        "\twhere options are:\n"
+        "\t--max-size <pixels>\n"
+        "\t--quality <1-95>\n"
+        "\t--ttl <seconds>\n"
+        "\t--output <file>|-\n"
+        "\t--info\n"
+        "\t--fake [<snapshot.json>]\n".format(os.path.basename(sys.argv[0]))
+    )
+    quit()
+
+
+randr = load_gnome_randr()
+
+
+def stage_geometry(config_info):
+    # size of the captured image for the first logical monitor: the shell
+    # captures in physical pixels, already rotated
+    for lm in config_info.logical_monitors:
+        conf = config_info.output_config[lm[5][0][0]]
+        w, h = conf["mode-info"][1], conf["mode-info"][2]
+        if lm[3] in [1, 3]:
+            w, h = h, w
+        return {"width": w, "height": h, "rotation": randr.trans_to_rot(lm[3]), "scale": lm[2]}
+    # e.g. the panel is unplugged
+    raise RuntimeError("no display enabled, nothing to capture")
+
+
+def encode_thumbnail(img, max_size, quality):
+    from io import BytesIO
+    from PIL import Image  # type: ignore
+
+    # reducing_gap lets PIL shrink by an integer factor before resampling,
+    # which is most of the win on a 4K capture
+    img.thumbnail((max_size, max_size), Image.BILINEAR, reducing_gap=2.0)
+    buf = BytesIO()
+    img.convert("RGB").save(buf, "JPEG", quality=quality, optimize=False)
+    return buf.getvalue()
+
+
+class ShellScreenshot:
+    def __init__(self):
+        import dbus  # type: ignore
+
+        self.dbus = dbus
+        self.bus = dbus.SessionBus()
+        shell = self.bus.get_object("org.gnome.Shell.Screenshot", "/org/gnome/Shell/Screenshot")
+        self.iface = dbus.Interface(shell, dbus_interface="org.gnome.Shell.Screenshot")
+        self.dc_iface = randr.connect_display_config(randr.Profiler())
+        self.dc_iface.connect_to_signal("MonitorsChanged", self.invalidate_geometry)
+        self.geometry_info = None
+        self.geometry_time = None
+        self.tmp_dir = os.environ.get("XDG_RUNTIME_DIR") or CACHE_DIR
+
+    def invalidate_geometry(self):
+        self.geometry_info = None
+
+    def geometry(self):
+        # MonitorsChanged may clear it from the main loop thread meanwhile
+        info = self.geometry_info
+        if info is None or time.monotonic() - self.geometry_time >= GEOMETRY_TTL:
+            serial, monitors, logical_monitors, properties = self.dc_iface.GetCurrentState()
+            info = stage_geometry(randr.ConfigInfo(serial, monitors, logical_monitors, properties))
+            self.geometry_info = info
+            self.geometry_time = time.monotonic()
+        # callers add their own fields to it
+        return dict(info)
+
+    def screenshot(self, path):
+        # the shell only serves a few well known callers; gnome-screenshot is one
+        # of them, so take over its name for the call when it isn't running
+        owned = False
+        try:
+            reply = self.bus.request_name("org.gnome.Screenshot", self.dbus.bus.NAME_FLAG_DO_NOT_QUEUE)
+            owned = reply == self.dbus.bus.REQUEST_NAME_REPLY_PRIMARY_OWNER
+        except self.dbus.exceptions.DBusException as e:
+            print("could not own org.gnome.Screenshot: {}".format(e.get_dbus_message()), file=sys.stderr)
+        try:
+            return self.iface.Screenshot(False, False, path)
+        finally:
+            if owned:
+                self.bus.release_name("org.gnome.Screenshot")
+
+    def capture(self):
+        from PIL import Image  # type: ignore
+
+        path = os.path.join(self.tmp_dir, "screenshot-{}-{}.png".format(os.getpid(), threading.get_ident()))
+        success, used = self.screenshot(path)
+        if not success:
+            raise RuntimeError("gnome-shell could not take a screenshot")
+        try:
+            with Image.open(used) as img:
+                img.load()
+                return img.copy()
+        finally:
+            os.unlink(used)
+
+
+class FakeScreenshot:
+    # stand-in for tests and development machines without gnome-shell; the
+    # geometry comes from a saved GetCurrentState snapshot when one is given
+    def __init__(self, state_path=None):
+        self.state_path = state_path
+
+    def geometry(self):
+        if not self.state_path:
+            return {"width": 2160, "height": 3840, "rotation": "left", "scale": 2.0}
+        serial, monitors, logical_monitors, properties = randr.load_state(self.state_path)
+        return stage_geometry(randr.ConfigInfo(serial, monitors, logical_monitors, properties))
+
+    def capture(self):
+        from PIL import Image  # type: ignore
+
+        geometry = self.geometry()
+        return Image.linear_gradient("L").resize((geometry["width"], geometry["height"])).convert("RGB")
+
+
+class ScreenshotService:
+    def __init__(self, backend, ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # (max-size, quality) -> (time, jpeg, info)
+        self.cache = dict()
+        self.pending = dict()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def thumbnail(self, max_size=DEFAULT_MAX_SIZE, quality=DEFAULT_QUALITY):
+        key = (max_size, quality)
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                return entry[1], entry[2]
+            # concurrent callers share one capture instead of queueing several
+            future = self.pending.get(key)
+            if not future:
+                future = self.executor.submit(self._thumbnail, key)
+                self.pending[key] = future
+        return future.result()
+
+    def _thumbnail(self, key):
+        try:
+            start = time.monotonic()
+            info = self.backend.geometry()
+            img = self.backend.capture()
+            captured = time.monotonic()
+            jpeg = encode_thumbnail(img, key[0], key[1])
+            info.update(
+                {
+                    "thumb-width": img.width,
+                    "thumb-height": img.height,
+                    "capture-time": captured - start,
+                    "encode-time": time.monotonic() - captured,
+                }
+            )
+            with self.lock:
+                self.cache[key] = (time.monotonic(), jpeg, info)
+            return jpeg, info
+        finally:
+            with self.lock:
+                del self.pending[key]
+
+
+def cached_file(path, ttl):
+    try:
+        return time.time() - os.stat(path).st_mtime < ttl
+    except FileNotFoundError:
+        return False
+
+
+def main():
+    max_size = DEFAULT_MAX_SIZE
+    quality = DEFAULT_QUALITY
+    ttl = DEFAULT_TTL
+    output = None
+    print_info = False
+    fake = None
+
+    n = 1
+    while n < len(sys.argv):
+        arg = sys.argv[n]
+        n += 1
+
+        if arg == "-h" or arg == "--help":
+            usage()
+        elif arg in ["--max-size", "--quality", "--ttl", "--output"]:
+            if n >= len(sys.argv):
+                fatal("{} requires an argument".format(arg))
+            if arg == "--max-size":
+                max_size = int(sys.argv[n])
+            elif arg == "--quality":
+                quality = int(sys.argv[n])
+            elif arg == "--ttl":
+                ttl = float(sys.argv[n])
+            else:
+                output = sys.argv[n]
+            n += 1
+        elif arg == "--info":
+            print_info = True
+        elif arg == "--fake":
+            fake = ""
+            if n < len(sys.argv) and not sys.argv[n].startswith("--"):
+                fake = sys.argv[n]
+                n += 1
+        else:
+            fatal("unrecognized option: {}".format(arg))
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # fake captures get their own files so the health API never serves them
+    backend_name = "fake-" if fake is not None else ""
+    thumb_path = os.path.join(CACHE_DIR, "thumb-{}{}-{}.jpg".format(backend_name, max_size, quality))
+    info_path = thumb_path + ".json"
+
+    if not cached_file(thumb_path, ttl):
+        backend = FakeScreenshot(fake or None) if fake is not None else ShellScreenshot()
+        try:
+            jpeg, info = ScreenshotService(backend, ttl).thumbnail(max_size, quality)
+        except RuntimeError as e:
+            fatal(str(e))
+        # write then rename so concurrent readers never see a partial file
+        for path, data in [(info_path, json.dumps(info).encode()), (thumb_path, jpeg)]:
+            tmp_path = "{}.{}".format(path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    if print_info:
+        with open(info_path) as f:
+            print(f.read())
+    elif output == "-":
+        with open(thumb_path, "rb") as f:
+            sys.stdout.buffer.write(f.read())
+    elif output:
+        with open(thumb_path, "rb") as src, open(output, "wb") as dst:
+            dst.write(src.read())
+    else:
+        print(thumb_path)
+
+
+if __name__ == "__main__":
+    main()